@@ -4,39 +4,85 @@ A simple python script for generating customizable typing videos and gifs.
 """
 
 import argparse
+import functools
+import hashlib
+import html
+import io
+import math
 import os
 import re
+import subprocess
 import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
-import moviepy.editor as mp
-import moviepy.video.fx.all as vfx
 import yaml
-from bs4 import BeautifulSoup
-from cairosvg import svg2png
 
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
 
-def _layout_remap(word, mapping):
+# Heavy dependencies (moviepy, numpy, PIL and the svg renderers) are only imported
+# where they are needed, so that e.g. --help and --all-layouts start instantly.
+
+# Special characters and the (expressive) ids of their svg objects
+_SPECIAL_MAP = {
+    " ": "space",
+    "\n": "enter",
+}
+
+# Style properties of a pressed key
+_PRESSED_STYLE = {"fill": "black", "fill-opacity": "0.2"}
+
+# Version of the cached keyboard frames, to be bumped whenever the rasterization
+# changes in a way that isn't captured by the svg, the renderer or the pressed style
+_FRAME_CACHE_VERSION = 2
+
+
+def _layout_table(mapping):
     """
-    Remap each character of a word to another layout using a dictionary.
+    Build a translation table remapping characters to another layout.
 
     Parameters
     ----------
-    word: string
-        The word to be remapped.
     mapping: dict
         The dictionary containing the mapping between the two layouts 
-        (e.g. {"A": "ち", "B": "こ", "C": "そ", ...}).
+        (e.g. {"A": "ち", "B": "こ", "C": "そ", ...}), where special characters are
+        referred to by the ids of their svg objects (e.g. "space").
+
+    Returns
+    -------
+    dict
+        A translation table for `str.translate`. Characters missing from `mapping` are
+        left as is, except for special characters which are replaced by their ids.
+    """
+    table = {c: mapping.get(special, special) for c, special in _SPECIAL_MAP.items()}
+    # Unquoted yaml keys such as `1: ぬ` are not strings and never match a character
+    table.update(
+        (key, str(value))
+        for key, value in mapping.items()
+        if isinstance(key, str) and len(key) == 1
+    )
+    return str.maketrans(table)
+
+
+def _layout_remap(word, table):
+    """
+    Remap each character of a word to another layout.
+
+    Parameters
+    ----------
+    word: string
+        The word to be remapped.
+    table: dict
+        The translation table between the two layouts, as returned by `_layout_table`.
     
     Returns
     -------
     string
         The resulting word after the remapping.
     """
-    res = ""
-    for c in word:
-        c = _remap_special(c)
-        res += mapping[c] if c in mapping else c
-    return res
+    return word.translate(table)
 
 
 def _get_relative_dir(relative_dir):
@@ -57,263 +103,914 @@ def _get_relative_dir(relative_dir):
     return os.path.join(main_dir_name, relative_dir)
 
 
-def _set_property(soup, object_id, prop, value):
+@functools.lru_cache(maxsize=None)
+def _properties_re(props):
+    """
+    Compile a single pattern matching any of the given style properties.
+
+    Parameters
+    ----------
+    props: tuple
+        The names of the properties (e.g. ("fill", "fill-opacity")).
+
+    Returns
+    -------
+    re.Pattern
+        The compiled pattern, capturing the name of the matched property.
+    """
+    return re.compile("(" + "|".join(map(re.escape, props)) + "):.+?;")
+
+
+def _set_properties(style, properties):
     """
-    Update a property of an object within an svg file.
+    Update a number of properties within the style attribute of an svg object.
 
     Parameters
     ----------
-    soup: bs4.BeautifulSoup
-        A BeautifulSoup object containing the contents of the svg (modified in place)
-    object_id: string
-        The id of the svg object to update. Either a single character (e.g. 'A') or
-        a special string (e.g. "Space") based on convetion.
-    prop: string
-        The property to update (e.g. "fill" or "fill-opacity").
-    value: string
-        The target value of the given property (e.g. "black", "0.1").
+    style: string
+        The contents of the style attribute (e.g. "fill:none;fill-opacity:1;stroke:#000000").
+    properties: dict
+        A dictionary of property/value pairs to be updated (e.g. {"fill": "black"}).
+
+    Returns
+    -------
+    string
+        The updated contents of the style attribute.
 
     Notes
     -----
-    Parameter `soup` is modified in place.
+    All properties are updated in a single pass over `style`.
     """
-    obj = soup.find(id=object_id)
-    obj["style"] = re.sub(f"{prop}:.+?;", f"{prop}:{value};", obj["style"])
+    return _properties_re(tuple(properties)).sub(
+        lambda m: f"{m.group(1)}:{properties[m.group(1)]};", style
+    )
 
 
-def _remap_special(c):
+def _index_styles(data):
     """
-    Remap special characters to valid svg object ids based on convetion.
+    Locate the style attribute of every svg object that has an id.
 
     Parameters
     ----------
-    c: string
-        The character to be remapped.
+    data: bytes
+        The contents of the svg file.
 
     Returns
     -------
-    string
-        A valid svg object id. Either the original character `c` or an expressive string
-        for special characters.
+    dict
+        A dictionary mapping each object id (e.g. 'A' or "space") to the `(start, end)`
+        offsets of its style attribute value within `data`.
     """
-    m = {
-        " ": "space",
-        "\n": "enter",
-    }
+    id_re = re.compile(rb'\sid="([^"]*)"')
+    style_re = re.compile(rb'\sstyle="([^"]*)"')
+
+    spans = {}
+    for tag in re.finditer(rb"<[^>]+>", data):
+        object_id = id_re.search(data, tag.start(), tag.end())
+        style = style_re.search(data, tag.start(), tag.end())
+        if object_id and style:
+            spans.setdefault(
+                html.unescape(object_id.group(1).decode()), (style.start(1), style.end(1))
+            )
+    return spans
+
+
+@functools.lru_cache(maxsize=8)
+def _load_keyboard(path, mtime):
+    """
+    Load and index a keyboard svg file.
+
+    Parameters
+    ----------
+    path: string
+        Path to a keyboard svg file.
+    mtime: float
+        The modification time of the file, so that edited files are reloaded.
 
-    if c in m:
-        c = m[c]
+    Returns
+    -------
+    tuple
+        The contents of the svg file (bytes) and the offsets of their style attributes,
+        as returned by `_index_styles`.
 
-    return c
+    Notes
+    -----
+    The result is cached, so repeated animations on the same keyboard (e.g. when
+    `animate` is called several times) only read and scan the svg once.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    return data, _index_styles(data)
 
 
-def _generate_frame(char, soup, properties, temp_dir_name, frame_num):
+def _generate_frame(char, svg, spans, properties):
     """
-    Generate a single frame of the (keyboard-only) animation.
+    Generate the svg of a single frame of the (keyboard-only) animation.
 
     Parameters
     ----------
     char: string
         The character currently being animated.
-    soup: bs4.BeautifulSoup
-        The BeautifulSoup containing the keyboard svg.
+    svg: bytearray
+        The contents of the keyboard svg.
+    spans: dict
+        The offsets of all style attributes within `svg`, as returned by `_index_styles`.
     properties: dict
         A dictionary of property/value pairs to be updated for this frame.
-    temp_dir_name: string
-        The directory in which the frames are temporary being stored.
-    frame_number: int
-        The number of the current frame.
+
+    Returns
+    -------
+    bytes
+        The serialized svg of the frame, ready to be rasterized by `_render_frame`.
+
+    Notes
+    -----
+    The style of `char` is spliced directly into `svg` and restored afterwards, so `svg`
+    (and therefore `spans`) is left unchanged. Shorter styles are padded with spaces to
+    the original length, so that the splice overwrites the bytes in place instead of
+    shifting the rest of the svg.
+    """
+    start, end = spans[char]
+    original = svg[start:end]
+    style = _set_properties(original.decode(), properties).encode()
+    svg[start:end] = style.ljust(len(original))
+    frame = bytes(svg)
+    svg[start : start + max(len(style), len(original))] = original
+    return frame
+
+
+@functools.lru_cache(maxsize=None)
+def _reused_png_surface():
+    """
+    Create a cairosvg png surface class drawing on a reused cairo image surface.
+
+    Returns
+    -------
+    type
+        A subclass of `cairosvg.surface.PNGSurface`.
+
+    Notes
+    -----
+    All frames of an animation have the same size, so instead of allocating a new cairo
+    image surface for every frame, each process keeps one surface per size and clears
+    it before drawing the next frame on it.
+    """
+    import cairocffi as cairo
+    from cairosvg.surface import PNGSurface
+
+    @functools.lru_cache(maxsize=None)
+    def image_surface(width, height):
+        return cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+
+    class ReusedPNGSurface(PNGSurface):
+        def _create_surface(self, width, height):
+            width, height = int(round(width)), int(round(height))
+            surface = image_surface(width, height)
+            context = cairo.Context(surface)
+            context.set_operator(cairo.OPERATOR_CLEAR)
+            context.paint()
+            return surface, width, height
+
+    return ReusedPNGSurface
+
+
+@functools.lru_cache(maxsize=None)
+def _resvg_sans_serif_family():
+    """
+    Find a font family resvg can draw the (sans-serif) key labels with.
+
+    Returns
+    -------
+    string
+        The name of an installed sans-serif font family.
+
+    Raises
+    ------
+    RuntimeError
+        If no candidate family actually draws any text.
 
     Notes
     -----
-    Writes directly to file '{temp_dir_name}/frame{frame_num}.png'
+    Unlike cairo, resvg doesn't resolve generic families through fontconfig but maps
+    "sans-serif" to a hardcoded family (Arial), so on most Linux systems the labels
+    would silently be left out. The family fontconfig picks for "sans-serif" is tried
+    first, followed by a few common ones, and each candidate is checked by rendering
+    a sample label.
     """
-    for prop in properties:
-        _set_property(soup, char, prop, properties[prop])
-    svg2png(
-        bytestring=str(soup),
-        write_to=f"{temp_dir_name}/frame{frame_num}.png",
+    import numpy as np
+    import resvg_py
+    from PIL import Image
+
+    candidates = ["DejaVu Sans", "Liberation Sans", "Noto Sans", "Arial", "Helvetica"]
+    try:
+        fc_match = subprocess.run(
+            ["fc-match", "--format=%{family[0]}", "sans-serif"],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        candidates.insert(0, fc_match.stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        pass
+
+    sample = (
+        '<svg xmlns="http://www.w3.org/2000/svg" width="32" height="32">'
+        '<text x="4" y="24" style="font-family:sans-serif;font-size:24px">A</text>'
+        "</svg>"
+    )
+    for family in filter(None, candidates):
+        png = resvg_py.svg_to_bytes(svg_string=sample, sans_serif_family=family)
+        if np.asarray(Image.open(io.BytesIO(bytes(png))).convert("RGBA"))[..., 3].any():
+            return family
+    raise RuntimeError(
+        "resvg could not find a sans-serif font to draw the key labels with, "
+        "use --renderer cairosvg instead"
     )
 
 
-def _create_frames(keyboard_svg, text):
+def _render_frame(svg, renderer):
     """
-    Generate all frames of keyboard animation and store them in a temporary folder.
+    Rasterize a single frame of the (keyboard-only) animation.
 
     Parameters
     ----------
-    keyboard_svg: string
-        Path to a keyboard svg file.
-    text: string
-        The text to be animated onto the keyboard.
+    svg: bytes
+        The serialized svg of the frame.
+    renderer: string
+        The svg renderer to be used. Either "resvg" (requires the optional `resvg_py`
+        package, see `_resvg_sans_serif_family`) or "cairosvg".
 
     Returns
     -------
-    temp_dir: tempfile.TemporaryDirectory
-        A reference to the (automatically generated) temporary directory containing all frames.
+    numpy.ndarray
+        The RGBA pixels of the frame.
+
+    Notes
+    -----
+    With cairosvg, the pixels are read straight from the cairo surface, skipping the png
+    encoding (and later decoding) that `cairosvg.svg2png` would require. The surface
+    itself is reused across frames (see `_reused_png_surface`).
     """
-    with open(keyboard_svg) as f:
-        data = f.read()
-    keyboard_soup = BeautifulSoup(data, "xml")
+    import numpy as np
 
-    temp_dir = tempfile.TemporaryDirectory()
-    temp_dir_name = temp_dir.name
+    if renderer == "resvg":
+        import resvg_py
+        from PIL import Image
 
-    frame_num = 0
+        png = resvg_py.svg_to_bytes(
+            svg_string=svg.decode(),
+            dpi=96,
+            sans_serif_family=_resvg_sans_serif_family(),
+        )
+        return np.asarray(Image.open(io.BytesIO(bytes(png))).convert("RGBA"))
+
+    from cairosvg.parser import Tree
+
+    surface = _reused_png_surface()(Tree(bytestring=svg), None, 96).cairo
+    surface.flush()
+    width, height = surface.get_width(), surface.get_height()
+
+    # cairo stores each pixel as a native-endian, premultiplied ARGB integer
+    pixels = np.frombuffer(surface.get_data(), np.uint32)
+    pixels = pixels.reshape(height, surface.get_stride() // 4)[:, :width]
+    alpha = pixels >> 24
+    rgb = np.dstack([(pixels >> shift) & 0xFF for shift in (16, 8, 0)])
+    rgb = np.where(
+        alpha[..., None] > 0,
+        (rgb * 255 + alpha[..., None] // 2) // np.maximum(alpha, 1)[..., None],
+        0,
+    )
+    return np.dstack((rgb, alpha)).astype(np.uint8)
 
-    _generate_frame(None, keyboard_soup, {}, temp_dir_name, frame_num)
 
-    frame_num += 1
+@functools.lru_cache(maxsize=None)
+def _resolve_font(family):
+    """
+    Find the font file fontconfig uses for a font family.
 
-    for char in text:
-        char = _remap_special(char)
+    Parameters
+    ----------
+    family: string
+        The name of the font family (e.g. "sans-serif").
 
-        _generate_frame(
-            char,
-            keyboard_soup,
-            {"fill": "black", "fill-opacity": "0.2"},
-            temp_dir_name,
-            frame_num,
+    Returns
+    -------
+    string
+        The path to the font file, or an empty string if fontconfig isn't available.
+    """
+    try:
+        fc_match = subprocess.run(
+            ["fc-match", "--format=%{file}", family],
+            capture_output=True,
+            text=True,
+            check=True,
         )
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+    return fc_match.stdout.strip()
+
+
+def _renderer_version(renderer):
+    """
+    Get the version of an svg renderer.
+
+    Parameters
+    ----------
+    renderer: string
+        The svg renderer (see `_render_frame`).
+
+    Returns
+    -------
+    string
+        The version of the renderer package (and, for cairosvg, of the cairo library).
+    """
+    import importlib.metadata
+
+    if renderer == "resvg":
+        return importlib.metadata.version("resvg_py")
+
+    import cairocffi
+
+    version = importlib.metadata.version("CairoSVG")
+    return f"{version}/{cairocffi.cairo_version_string()}"
+
+
+def _frame_cache_dir(svg, renderer):
+    """
+    Get the directory caching the rendered frames of a keyboard.
+
+    Parameters
+    ----------
+    svg: bytes
+        The contents of the keyboard svg file.
+    renderer: string
+        The svg renderer used for the frames (see `_render_frame`).
+
+    Returns
+    -------
+    string
+        The path to the (possibly not yet existing) cache directory, inside
+        `$XDG_CACHE_HOME/typingvid` (`~/.cache/typingvid` by default).
+
+    Notes
+    -----
+    The directory is named after a hash of everything the frames depend on: the svg
+    contents, the pressed key style, `_FRAME_CACHE_VERSION`, the renderer version and
+    the font file resolved for every font family used by the labels (as well as, for
+    resvg, the family drawing "sans-serif"). Changing any of them, e.g. by installing
+    a missing font, never reuses stale frames.
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    digest = hashlib.blake2b(svg, digest_size=8)
+    digest.update(repr(sorted(_PRESSED_STYLE.items())).encode())
+    digest.update(str(_FRAME_CACHE_VERSION).encode())
+    digest.update(_renderer_version(renderer).encode())
+    families = re.findall(rb"""font-family(?::|=")\s*([^;"]+)""", svg)
+    for family in sorted({family.decode().strip(" '") for family in families}):
+        digest.update(f"{family}={_resolve_font(family)}".encode())
+    if renderer == "resvg":
+        digest.update(_resvg_sans_serif_family().encode())
+    return os.path.join(cache_home, "typingvid", f"{renderer}-{digest.hexdigest()}")
+
+
+def _load_cached_frame(path):
+    """
+    Load a previously rendered keyboard frame from the cache.
+
+    Parameters
+    ----------
+    path: string
+        Path to the cached frame.
+
+    Returns
+    -------
+    numpy.ndarray
+        The RGBA pixels of the frame, or None if it isn't cached (or unreadable).
+    """
+    import numpy as np
+    from PIL import Image
+
+    try:
+        with Image.open(path) as image:
+            return np.asarray(image.convert("RGBA"))
+    except (OSError, ValueError):
+        return None
 
-        frame_num += 1
 
-        _generate_frame(
-            char,
-            keyboard_soup,
-            {"fill": "none", "fill-opacity": "1"},
-            temp_dir_name,
-            frame_num,
+def _cache_frame(path, pixels):
+    """
+    Store a rendered keyboard frame in the cache.
+
+    Parameters
+    ----------
+    path: string
+        Path to the cached frame.
+    pixels: numpy.ndarray
+        The RGBA pixels of the frame.
+
+    Notes
+    -----
+    The frame is written to a temporary file which is then renamed, so concurrent
+    runs never read partially written frames. Failing to write the cache (e.g. on a
+    read-only file system) is not an error.
+    """
+    from PIL import Image
+
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        Image.fromarray(pixels).save(temp_path, format="PNG", compress_level=1)
+        os.replace(temp_path, path)
+    except OSError:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+
+
+def _create_frames(keyboard_svg, text, renderer, cache=True):
+    """
+    Generate all frames of keyboard animation.
+
+    Parameters
+    ----------
+    keyboard_svg: string
+        Path to a keyboard svg file.
+    text: string
+        The text to be animated onto the keyboard.
+    renderer: string
+        The svg renderer to be used (see `_render_frame`).
+    cache: bool
+        Whether rendered frames are read from and written to the on-disk cache.
+
+    Returns
+    -------
+    list
+        The RGBA pixels (numpy.ndarray) of every frame. Identical frames share the
+        same array, a view into a single stack holding all distinct frames.
+
+    Notes
+    -----
+    Unless `cache` is disabled, rendered frames are cached on disk (see
+    `_frame_cache_dir`), so every key of a keyboard is only rasterized once, across
+    all animations.
+    """
+    import numpy as np
+
+    data, spans = _load_keyboard(keyboard_svg, os.path.getmtime(keyboard_svg))
+    keyboard_data = bytearray(data)
+
+    # The whole animation is planned up front as the id of the pressed key in every
+    # frame (None for the neutral keyboard). Releasing a key resets it to "fill:none",
+    # which is exactly how every key is drawn in the keyboard svg, so every release
+    # shows the neutral keyboard.
+    keys = [None] * (2 * len(text) + 1)
+    keys[1::2] = [_SPECIAL_MAP.get(char, char) for char in text]
+
+    # Identical frames (every release and every press of a repeated character) are
+    # only generated and rasterized once, into a single preallocated stack. Generating
+    # the svgs is cheap and done serially, while the expensive rasterization is spread
+    # over all cores. The svgs are generated lazily, so that the workers already
+    # rasterize the first chunks while the rest are still being generated.
+    renders = {key: n for n, key in enumerate(dict.fromkeys(keys))}
+
+    if renderer == "resvg":
+        # Fail early if the labels can't be drawn (the workers inherit the result)
+        _resvg_sans_serif_family()
+
+    if cache:
+        cache_dir = _frame_cache_dir(data, renderer)
+        paths = {
+            key: os.path.join(
+                cache_dir, "neutral.png" if key is None else f"{key.encode().hex()}.png"
+            )
+            for key in renders
+        }
+        cached = {key: _load_cached_frame(path) for key, path in paths.items()}
+    else:
+        cached = dict.fromkeys(renders)
+    missing = [key for key, pixels in cached.items() if pixels is None]
+
+    svgs = (
+        data
+        if key is None
+        else _generate_frame(key, keyboard_data, spans, _PRESSED_STYLE)
+        for key in missing
+    )
+
+    # There are only a few dozen distinct frames at most, each taking far longer to
+    # rasterize than to send to a worker, so they are handed out one at a time to keep
+    # every worker busy.
+    workers = max(min(len(missing), os.cpu_count() or 1), 1)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        rendered = executor.map(
+            functools.partial(_render_frame, renderer=renderer), svgs
         )
+        stack = None
+        for key, n in renders.items():
+            pixels = cached.pop(key)
+            if pixels is None:
+                pixels = next(rendered)
+                if cache:
+                    _cache_frame(paths[key], pixels)
+            if stack is None:
+                stack = np.empty((len(renders), *pixels.shape), dtype=np.uint8)
+            stack[n] = pixels
+
+    views = list(stack)
+    return [views[renders[key]] for key in keys]
+
+
+def _render_label(text, font, kerning=None):
+    """
+    Render a piece of text the way it appears on the display(s).
 
-        frame_num += 1
+    Parameters
+    ----------
+    text: string
+        The text to be rendered, possibly spanning multiple lines.
+    font: string
+        The font to be used for the text.
+    kerning: int
+        The spacing between characters, if any.
 
-    return temp_dir
+    Returns
+    -------
+    numpy.ndarray
+        The RGBA pixels of the rendered text.
+
+    Notes
+    -----
+    ImageMagick briefly reads the text from and stores the rendered text in temporary
+    files, kept in RAM when a tmpfs is available.
+    """
+    import moviepy.editor as mp
+    import numpy as np
+
+    tmpfs = "/dev/shm" if os.path.isdir("/dev/shm") else None
+    with tempfile.TemporaryDirectory(dir=tmpfs) as temp_dir_name:
+        # moviepy only writes the text file itself when it picks its location
+        temptxt = os.path.join(temp_dir_name, "label.txt")
+        with open(temptxt, "w", encoding="utf-8") as f:
+            f.write(text)
+        clip = mp.TextClip(
+            text,
+            color="black",
+            kerning=kerning,
+            fontsize=31,
+            font=font,
+            tempfilename=os.path.join(temp_dir_name, "label.png"),
+            temptxt=temptxt,
+        )
+    return np.dstack((clip.img, np.round(clip.mask.img * 255))).astype(np.uint8)
 
 
-def _generate_keyboard_clip(temp_dir, T):
+@functools.lru_cache(maxsize=None)
+def _render_glyph(char, font):
     """
-    Combine previously generated keyboard frames to a single MoviePy clip.
+    Render a single character the way it appears on the display(s).
 
     Parameters
     ----------
-    temp_dir: tempfile.TemporaryDirectory
-        A reference to the (automatically generated) temporary directory containing all frames.
-    T: float
-        The duration of each frame in seconds.
+    char: string
+        The character to be rendered.
+    font: string
+        The font to be used for the character.
 
     Returns
     -------
-    moviepy.video.VideoClip.VideoClip
-        The resulting MoviePy clip.
+    numpy.ndarray
+        The (read-only) RGBA pixels of the rendered character.
+
+    Notes
+    -----
+    The result is cached, so every character is only rendered once per font, no matter
+    how many texts are animated.
     """
-    clips = [
-        mp.ImageClip(f"{temp_dir.name}/frame{n}.png").set_duration(T)
-        for n in range(len(os.listdir(temp_dir.name)))
-    ]
-    keyboard_clip = mp.concatenate_videoclips(clips)
-    return keyboard_clip
+    glyph = _render_label(char, font)
+    glyph.setflags(write=False)
+    return glyph
 
 
-def _generate_text_clip(text, T, font):
+def _generate_text_frames(text, font):
     """
-    Create a simple MoviePy clip of text slowly appearing to be used on the display(s).
+    Generate the frames of text slowly appearing to be used on the display(s).
 
     Parameters
     ----------
     text: string
         The string to be animated.
-    T: float
-        The duration of single keypress.
     font: string
         The font to be used for the text.
 
     Returns
     -------
-    moviepy.video.VideoClip.VideoClip
-        The resulting MoviePy clip.
-    """
-    return mp.concatenate_videoclips(
-        [
-            mp.TextClip(
-                f"> {text[:i]}|",
-                color="black",
-                kerning=5,
-                fontsize=31,
-                font=font,
-            ).set_duration(2 * T)
-            for i in range(0, len(text) + 1)
-        ]
+    list
+        The RGBA pixels (numpy.ndarray) of every frame, each one lasting two keyboard frames.
+
+    Notes
+    -----
+    Every distinct character is only rendered once; the frames (one for each prefix
+    of `text`, followed by a cursor) are assembled from these glyphs. Text spanning
+    multiple lines is laid out by ImageMagick instead, one label per prefix.
+    """
+    import numpy as np
+
+    kerning = 5
+    line = f"> {text}"
+
+    if "\n" in text:
+        prefixes = [f"> {text[:i]}|" for i in range(len(text) + 1)]
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            return list(
+                executor.map(lambda p: _render_label(p, font, kerning), prefixes)
+            )
+
+    # Each glyph is rendered by an ImageMagick subprocess, so threads are enough to
+    # render them concurrently
+    chars = list(set(line + "|"))
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        glyphs = dict(zip(chars, executor.map(lambda c: _render_glyph(c, font), chars)))
+    height = max(glyph.shape[0] for glyph in glyphs.values())
+    glyphs = {
+        char: np.pad(glyph, ((0, height - glyph.shape[0]), (0, 0), (0, 0)))
+        for char, glyph in glyphs.items()
+    }
+
+    gap = np.zeros((height, kerning, 4), dtype=np.uint8)
+    canvas = np.hstack([tile for char in line for tile in (glyphs[char], gap)])
+    ends = np.cumsum([glyphs[char].shape[1] + kerning for char in line])
+
+    cursor = glyphs["|"]
+    width = ends[-1] + cursor.shape[1]
+
+    frames = []
+    for i in range(len(text) + 1):
+        end = ends[i + 1]
+        frame = np.zeros((height, width, 4), dtype=np.uint8)
+        frame[:, :end] = canvas[:, :end]
+        frame[:, end : end + cursor.shape[1]] = cursor
+        frames.append(frame)
+
+    return frames
+
+
+@functools.lru_cache(maxsize=4)
+def _load_background(path):
+    """
+    Load a background image of the display(s).
+
+    Parameters
+    ----------
+    path: string
+        Path to the background image.
+
+    Returns
+    -------
+    numpy.ndarray
+        The RGB pixels of the background (flattened over black).
+
+    Notes
+    -----
+    The result is cached (and therefore read-only), so every background image is only
+    decoded once per process.
+    """
+    import numpy as np
+    from PIL import Image
+
+    pixels = np.asarray(Image.open(path).convert("RGBA"))
+    background = _compose_frame(np.zeros_like(pixels[..., :3]), [(pixels, (0, 0))])
+    background.setflags(write=False)
+    return background
+
+
+def _resize_frame(frame, factor):
+    """
+    Resize a frame by a constant factor.
+
+    Parameters
+    ----------
+    frame: numpy.ndarray
+        The RGBA pixels of the frame.
+    factor: float
+        The scaling factor (e.g. 0.69).
+
+    Returns
+    -------
+    numpy.ndarray
+        The RGBA pixels of the resized frame.
+    """
+    import numpy as np
+    from PIL import Image
+
+    height, width = frame.shape[:2]
+    image = Image.fromarray(frame).resize(
+        (int(width * factor), int(height * factor)), Image.LANCZOS
     )
+    return np.asarray(image)
+
 
+def _compose_frame(background, layers):
+    """
+    Alpha-blend a number of layers over a background.
+
+    Parameters
+    ----------
+    background: numpy.ndarray
+        The RGB pixels of the background.
+    layers: list
+        A list of `(pixels, (x, y))` pairs, where `pixels` are the RGBA pixels of the
+        layer and `(x, y)` the position of its top-left corner. Layers are blended in order
+        and clipped to the background.
 
-def _generate_composite_clip(background_clip, keyboard_clip, txt_clips):
+    Returns
+    -------
+    numpy.ndarray
+        The RGB pixels of the resulting frame.
     """
-    Create the final clip containing the keyboard and either one or two displays.
+    frame = background.copy()
+    for pixels, (x, y) in layers:
+        top, left = max(-y, 0), max(-x, 0)
+        pixels = pixels[top : frame.shape[0] - y, left : frame.shape[1] - x]
+        x, y = x + left, y + top
+        region = frame[y : y + pixels.shape[0], x : x + pixels.shape[1]]
+        alpha = pixels[..., 3:] / 255
+        region[:] = alpha * pixels[..., :3] + (1 - alpha) * region
+    return frame
+
+
+def _invert_frame(frame):
+    """
+    Invert the colors of a frame in place.
 
     Parameters
     ----------
-    background_clip: moviepy.video.VideoClip.ImageClip
-        A simple image clip of the background to be used for the video.
-    keyboard_clip: moviepy.video.VideoClip.VideoClip
-        The animated keyboard clip generated by `_generate_keyboard_clip`.
-    txt_clips: list
-        A list containing either one or two text clips generated by `_generate_text_clip`
+    frame: numpy.ndarray
+        The RGB pixels of the frame.
 
     Returns
     -------
-    moviepy.video.VideoClip.VideoClip
-        The resulting (composite) video clip.
-    """
-    if len(txt_clips) == 2:
-        cvc = mp.CompositeVideoClip(
-            [
-                background_clip,
-                keyboard_clip.resize(0.69).set_pos(("center", 0.4), relative=True),
-                txt_clips[0].set_pos((351, 230)),
-                txt_clips[1].set_pos((351, 335)),
-            ]
-        ).set_duration(keyboard_clip.duration)
-
-        cvc = vfx.crop(cvc, x1=247.72, y1=132.38, width=1424.56, height=815.24)
-    elif len(txt_clips) == 1:
-        cvc = mp.CompositeVideoClip(
-            [
-                background_clip,
-                keyboard_clip.resize(0.69).set_pos(("center", 380)),
-                txt_clips[0].set_pos((351, 282)),
-            ]
-        ).set_duration(keyboard_clip.duration)
-        cvc = vfx.crop(cvc, x1=269.5, y1=199.5, width=1381, height=681)
-    return cvc
-
-
-def _export_clip(clip, filename):
-    """
-    Export a clip to a media file based on its extension.
+    numpy.ndarray
+        The same array, holding the inverted pixels.
+    """
+    import numpy as np
+
+    return np.subtract(255, frame, out=frame)
+
+
+def _generate_composite_frames(background, keyboard_frames, text_frames):
+    """
+    Create the final frames containing the keyboard and either one or two displays.
 
     Parameters
     ----------
-    clip: moviepy.video.VideoClip.VideoClip
-        The clip to be written.
+    background: numpy.ndarray
+        The RGB pixels of the background to be used for the video.
+    keyboard_frames: list
+        The RGBA pixels of every keyboard frame, as returned by `_create_frames`.
+    text_frames: list
+        A list containing the frames of either one or two displays, as returned
+        by `_generate_text_frames`.
+
+    Returns
+    -------
+    function
+        A function composing the RGB pixels (numpy.ndarray) of the n-th frame, one
+        for each keyboard frame.
+
+    Notes
+    -----
+    Frames are composed directly with numpy (instead of a `CompositeVideoClip`). The
+    background is cropped once up front and all layers are positioned relative to the
+    crop, so only the visible pixels are ever composed.
+    """
+    height, width = background.shape[:2]
+
+    if len(text_frames) == 2:
+        keyboard_y = int(0.4 * height)
+        text_positions = [(351, 230), (351, 335)]
+        x1, y1, crop_width, crop_height = 247.72, 132.38, 1424.56, 815.24
+    elif len(text_frames) == 1:
+        keyboard_y = 380
+        text_positions = [(351, 282)]
+        x1, y1, crop_width, crop_height = 269.5, 199.5, 1381, 681
+
+    resized = {}
+    for frame in keyboard_frames:
+        if id(frame) not in resized:
+            resized[id(frame)] = _resize_frame(frame, 0.69)
+    keyboard_x = int((width - resized[id(keyboard_frames[0])].shape[1]) / 2)
+
+    left, top = int(x1), int(y1)
+    background = background[top : int(y1 + crop_height), left : int(x1 + crop_width)]
+    keyboard_position = (keyboard_x - left, keyboard_y - top)
+    text_positions = [(x - left, y - top) for x, y in text_positions]
+
+    def compose(n):
+        layers = [(resized[id(keyboard_frames[n])], keyboard_position)]
+        for frames, position in zip(text_frames, text_positions):
+            layers.append((frames[min(n // 2, len(frames) - 1)], position))
+        return _compose_frame(background, layers)
+
+    return compose
+
+
+def _export_frames(make_frame, durations, filename):
+    """
+    Export a sequence of frames to a media file based on its extension.
+
+    Parameters
+    ----------
+    make_frame: function
+        A function returning the RGB pixels (numpy.ndarray) of the n-th frame.
+    durations: list
+        The duration of every frame in seconds.
     filename: string
         The path to the output file. Extension can be either `.mp4` or `.gif`.
+
+    Notes
+    -----
+    Frames are streamed as raw pixels straight into ffmpeg, at the rate of the shortest
+    frame instead of the output frame rate, so that frames lasting several output frames
+    are only generated and piped once (or once per shortest duration) and ffmpeg picks
+    the output frames itself. Gifs are encoded with a palette generated from the frames
+    themselves (palettegen/paletteuse).
     """
+    from moviepy.config import get_setting
+
     ext = filename.split(".")[1]
     if ext == "gif":
-        clip.write_gif(filename, fps=10, logger=None)
+        fps = 10
+        codec = [
+            "-filter_complex",
+            f"[0:v]fps={fps}:round=up,split[a][b];[a]palettegen[p];[b][p]paletteuse",
+        ]
     elif ext == "mp4":
-        clip.write_videofile(filename, fps=24, logger=None)
+        fps = 24
+        codec = [
+            "-vf",
+            f"fps={fps}:round=up",
+            "-vcodec",
+            "libx264",
+            "-preset",
+            "veryfast",
+            "-crf",
+            "23",
+            "-tune",
+            "stillimage",
+            "-threads",
+            str(os.cpu_count() or 0),
+        ]
+    else:
+        return
+
+    # Longer frames are repeated, so that every input frame lasts exactly `period`
+    period = min(durations)
+    repeats = [math.ceil(round(duration / period, 6)) for duration in durations]
+
+    height, width = make_frame(0).shape[:2]
+    if ext == "mp4" and width % 2 == 0 and height % 2 == 0:
+        codec += ["-pix_fmt", "yuv420p"]
+
+    cmd = [
+        get_setting("FFMPEG_BINARY"),
+        "-y",
+        "-loglevel", "error",
+        "-f", "rawvideo",
+        "-vcodec", "rawvideo",
+        "-s", f"{width}x{height}",
+        "-pix_fmt", "rgb24",
+        "-r", f"{1 / period:.06f}",
+        "-an", "-i", "-",
+        *codec,
+        "-frames:v", str(math.ceil(round(sum(durations) * fps, 6))),
+        filename,
+    ]
+    proc = subprocess.Popen(
+        cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+
+    try:
+        for n, repeat in enumerate(repeats):
+            data = make_frame(n).tobytes()
+            for _ in range(repeat):
+                proc.stdin.write(data)
+    except BrokenPipeError:
+        pass
 
+    _, error = proc.communicate()
+    if proc.returncode:
+        raise IOError(f"ffmpeg failed to write {filename}:\n{error.decode()}")
 
-def _create_video(temp_dir, layout, args):
+
+def _create_video(frames, layout, args):
     """
     Create a fully-fledged keyboard animation video using the previously generated keyboard frames.
     
     Parameters
     ----------
-    temp_dir: tempfile.TemporaryDirectory
-        A reference to the (automatically generated) temporary directory containing all frames.
+    frames: list
+        The RGBA pixels of every keyboard frame, as returned by `_create_frames`.
     layout: dict
         A dictionary resulting from reading an appropriate yaml layout file.
         Should at least include the `file` and `fonts` keys.
@@ -324,56 +1021,52 @@ def _create_video(temp_dir, layout, args):
 
     T = 1 / args.speed
 
-    keyboard_clip = _generate_keyboard_clip(temp_dir, T)
+    if args.no_display and args.invert_colors:
+        inverted = {id(frame): 255 - frame[..., :3] for frame in frames}
+        make_frame = lambda n: inverted[id(frames[n])]
 
-    if args.no_display:
-        final_clip = keyboard_clip
+    elif args.no_display:
+        make_frame = lambda n: frames[n][..., :3]
 
     elif len(layout["fonts"]) == 2:
-        background_clip = mp.ImageClip(f"{_get_relative_dir('assets')}/dual_display_background.png")
-        upper_text_clip = _generate_text_clip(
+        background = _load_background(
+            f"{_get_relative_dir('assets')}/dual_display_background.png"
+        )
+        upper_text_frames = _generate_text_frames(
             args.text if not args.force_lowercase else args.text.lower(),
-            T,
             layout["fonts"][0],
         )
 
-        remapped_text = _layout_remap(args.text, layout["mapping"])
+        remapped_text = _layout_remap(args.text, _layout_table(layout["mapping"]))
 
-        lower_text_clip = _generate_text_clip(
+        lower_text_frames = _generate_text_frames(
             remapped_text if not args.force_lowercase else remapped_text.lower(),
-            T,
             layout["fonts"][1],
         )
 
-        final_clip = _generate_composite_clip(
-            background_clip, keyboard_clip, [upper_text_clip, lower_text_clip]
+        make_frame = _generate_composite_frames(
+            background, frames, [upper_text_frames, lower_text_frames]
         )
 
     elif len(layout["fonts"]) == 1:
-        background_clip = mp.ImageClip(f"{_get_relative_dir('assets')}/mono_display_background.png")
-        txt_clip = _generate_text_clip(
+        background = _load_background(
+            f"{_get_relative_dir('assets')}/mono_display_background.png"
+        )
+        text_frames = _generate_text_frames(
             args.text if not args.force_lowercase else args.text.lower(),
-            T,
             layout["fonts"][0],
         )
-        final_clip = _generate_composite_clip(
-            background_clip, keyboard_clip, [txt_clip]
-        )
+        make_frame = _generate_composite_frames(background, frames, [text_frames])
 
-    if args.invert_colors:
-        final_clip = final_clip.fx(vfx.invert_colors)
+    if args.invert_colors and not args.no_display:
+        # Every composed frame is a new array, so it can be inverted in place
+        make_frame = lambda n, make_frame=make_frame: _invert_frame(make_frame(n))
 
+    durations = [T] * len(frames)
     if args.hold_last_frame > 0:
-        final_clip = final_clip.fx(
-            vfx.freeze,
-            t="end",
-            padding_end=1 / 100,
-            freeze_duration=args.hold_last_frame,
-        )
-
-    _export_clip(final_clip, args.output)
+        durations[-1] += args.hold_last_frame
 
-    temp_dir.cleanup()
+    _export_frames(make_frame, durations, args.output)
 
 def _show_all_layouts():
     layouts = []
@@ -427,6 +1120,17 @@ def _parse_arguments():
         action="store_true",
         help="print all available layouts and exit",
     )
+    parser.add_argument(
+        "--renderer",
+        choices=["resvg", "cairosvg"],
+        default="cairosvg",
+        help="the svg renderer to use for the keyboard (default: cairosvg, resvg requires resvg-py)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="neither read nor store rendered keyboard frames in the cache",
+    )
     parser.add_argument(
         "--no-display",
         action="store_true",
@@ -470,10 +1174,15 @@ def animate(layout, args):
     """
     print("Generating frames... ", end="", flush=True)
     asset = os.path.join(_get_relative_dir("assets/"), layout['file'])
-    frames_dir = _create_frames(asset, args.text)
+    # Namespaces built by library callers may predate the --renderer and --no-cache
+    # options
+    renderer = getattr(args, "renderer", "cairosvg")
+    frames = _create_frames(
+        asset, args.text, renderer, not getattr(args, "no_cache", False)
+    )
     print("frames successfully generated.")
     print("Generating output file... ", end="", flush=True)
-    _create_video(frames_dir, layout, args)
+    _create_video(frames, layout, args)
     print(f"output file {args.output} successfully generated.")
 
 
@@ -487,7 +1196,7 @@ def main():
     layouts_dir = _get_relative_dir("layouts/")
     layout_file = os.path.join(layouts_dir, args.layout) + ".yml"
     with open(layout_file) as f:
-        layout = yaml.safe_load(f)
+        layout = yaml.load(f, Loader=SafeLoader)
 
     animate(layout, args)
 